@@ -11,12 +11,14 @@ This is a first-line control. Not a silver bullet.
 import re
 import logging
 import unicodedata
+from functools import lru_cache
+from typing import Any
 
 # ----------------------------
 # Bucket Definitions
 # ----------------------------
 
-BUCKETS = {
+BUCKETS: dict[str, dict[str, Any]] = {
     "authority_override": {
         "risk": "high",
         "weight": 4,
@@ -114,6 +116,27 @@ LEET_MAP = str.maketrans({
     "|": "l"
 })
 
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+
+
+def _build_ascii_table() -> dict[int, str]:
+    """
+    One translate table doing lowercase, leetspeak folding and punctuation
+    removal for ASCII input.
+    """
+    table: dict[int, str] = {}
+    for code in range(128):
+        char = chr(code)
+        if char.isalnum():
+            table[code] = char.lower()
+        else:
+            table[code] = " "
+    table.update(LEET_MAP)
+    return table
+
+
+_ASCII_TABLE = _build_ascii_table()
+
 
 def normalize(text: str) -> str:
     """
@@ -125,11 +148,12 @@ def normalize(text: str) -> str:
     - Collapse multiple whitespace into single spaces
     - Strip leading/trailing whitespace
     """
+    if text.isascii():  # NFKC leaves ASCII unchanged
+        return " ".join(text.translate(_ASCII_TABLE).split())
+
     text = unicodedata.normalize("NFKC", text).lower()
     text = text.translate(LEET_MAP)
-    text = text.replace("_", " ")
-    text = re.sub(r"[^a-z0-9\s]", " ", text)  # Replace punctuation with spaces
-    text = re.sub(r"\s+", " ", text)  # Collapse whitespace
+    text = _NON_ALNUM_RE.sub(" ", text)  # Punctuation, underscores and whitespace runs become one space
     return text.strip()
 
 
@@ -146,8 +170,8 @@ def squash_single_letters(tokens: list[str]) -> list[str]:
     if not tokens:
         return []
 
-    out = []
-    run = []
+    out: list[str] = []
+    run: list[str] = []
     for token in tokens:
         if len(token) == 1:
             run.append(token)
@@ -164,9 +188,15 @@ def squash_single_letters(tokens: list[str]) -> list[str]:
     return out
 
 
+# Three or more single-character tokens in a row, the only input squashing changes.
+_SPACED_LETTERS_RE = re.compile(r"(?<!\S)\S(?:\s+\S){2,}(?!\S)")
+
+
 def tokenize(text: str) -> list[str]:
     if not text:
         return []
+    if not _SPACED_LETTERS_RE.search(text):
+        return text.split()
     return squash_single_letters(text.split())
 
 
@@ -175,22 +205,185 @@ def tokenize(text: str) -> list[str]:
 # ----------------------------
 
 
-def _keyword_pattern(keyword_tokens: list[str]) -> str:
-    if not keyword_tokens:
-        return ""
-    if len(keyword_tokens) == 1:
-        return r"\b" + re.escape(keyword_tokens[0]) + r"\b"
+# Any hit in a bucket with one of these risks blocks outright.
+_HARD_STOP_RISKS = frozenset({"critical", "high"})
+
+# Trie node keys for the keyword ending at a node and for the widest gap any
+# keyword below it allows. Tokens are alphanumeric after normalization, so
+# neither can collide with a word.
+_TERMINAL = "$"
+_MAX_GAP = "#"
+
+
+def _keyword_max_gap(token_count: int) -> int:
+    """
+    Number of extra words tolerated between consecutive words of a multi-word keyword.
+    """
+    return 2 if token_count >= 3 else 1
+
+
+def _build_keyword_trie(keywords: tuple[str, ...]) -> dict[str, Any]:
+    """
+    Build a trie of multi-word keyword sequences ending in (keyword ids, max gap), e.g.
+    {"system": {"#": 1, "prompt": {"$": ((34,), 1)}, ...}, ...}
+    A keyword listed in several buckets has one id per bucket.
+    """
+    trie: dict[str, Any] = {}
+    for keyword_id, keyword in enumerate(keywords):
+        keyword_tokens = keyword.split()
+        if len(keyword_tokens) < 2:
+            continue
+        max_gap = _keyword_max_gap(len(keyword_tokens))
+        node = trie.setdefault(keyword_tokens[0], {})
+        for token in keyword_tokens[1:]:
+            node[_MAX_GAP] = max(node.get(_MAX_GAP, 0), max_gap)
+            node = node.setdefault(token, {})
+        keyword_ids = node[_TERMINAL][0] if _TERMINAL in node else ()
+        node[_TERMINAL] = (keyword_ids + (keyword_id,), max_gap)
+    return trie
+
+
+# Matching tables derived from BUCKETS, all filled in by _load_tables.
+# Bucket metadata is kept as parallel tuples indexed by bucket id, and
+# keywords as parallel tuples indexed by keyword id. Keyword ids follow
+# BUCKETS order, so sorted ids yield buckets and their matches in
+# declaration order.
+_BUCKET_NAMES: tuple[str, ...] = ()
+_BUCKET_RISKS: tuple[str, ...] = ()
+_BUCKET_WEIGHTS: tuple[int, ...] = ()
+_KEYWORDS: tuple[str, ...] = ()
+_KEYWORD_BUCKETS: tuple[int, ...] = ()
+_KEYWORD_TRIE: dict[str, Any] = {}
+
+# Single-word keywords need no gap handling; list.count finds them in C.
+_SINGLE_WORD_KEYWORDS: tuple[tuple[int, str], ...] = ()
+
+# Every keyword occurrence starts with one of these words. Word gaps make
+# adjacent-pair (bigram) checks unsafe, but a first word is always present.
+_KEYWORD_START_WORDS: frozenset[str] = frozenset()
+
+
+def _walk_trie(node: dict[str, Any], tokens: list[str], pos: int, widest_gap: int, ends: dict[int, int]) -> None:
+    """
+    Record in `ends` the index of the last token of every keyword reachable
+    from `node`, where `pos` is the index of the token that led to `node`.
+    Wider gaps are tried first, so the first end recorded for a keyword is
+    the one a greedy gap regex would have found.
+    """
+    terminal = node.get(_TERMINAL)
+    if terminal is not None:
+        keyword_ids, max_gap = terminal
+        if widest_gap <= max_gap and keyword_ids[0] not in ends:
+            for keyword_id in keyword_ids:
+                ends[keyword_id] = pos
+
+    # Leaf nodes have no _MAX_GAP, so the search stops there.
+    for gap in range(node.get(_MAX_GAP, -1), -1, -1):
+        nxt = pos + 1 + gap
+        if nxt >= len(tokens):
+            continue
+        child = node.get(tokens[nxt])
+        if child is not None:
+            _walk_trie(child, tokens, nxt, max(widest_gap, gap), ends)
+
+
+def _count_keywords(tokens: list[str]) -> dict[int, int]:
+    """
+    Count non-overlapping occurrences of every keyword in one pass over the tokens.
+    Returns counts keyed by keyword id.
+    """
+    counts: dict[int, int] = {}
+    if _KEYWORD_START_WORDS.isdisjoint(tokens):  # Cheap exit for benign messages
+        return counts
+
+    for keyword_id, keyword in _SINGLE_WORD_KEYWORDS:
+        found = tokens.count(keyword)
+        if found:
+            counts[keyword_id] = found
+
+    resume: dict[int, int] = {}  # first token index a new occurrence may start at
+    for start, token in enumerate(tokens):
+        node = _KEYWORD_TRIE.get(token)
+        if node is None:
+            continue
+
+        ends: dict[int, int] = {}
+        _walk_trie(node, tokens, start, 0, ends)
+        for keyword_id, end in ends.items():
+            if start >= resume.get(keyword_id, 0):
+                counts[keyword_id] = counts.get(keyword_id, 0) + 1
+                resume[keyword_id] = end + 1
+
+    return counts
+
+
+@lru_cache(maxsize=4096)
+def _cached_keyword_counts(user_text: str) -> tuple[tuple[int, int], ...]:
+    """
+    Normalize, tokenize and count keywords for a raw message.
+    Cached because chat messages repeat; returns (keyword id, count) pairs
+    sorted by id, as a tuple so cached results cannot be mutated by callers.
+    """
+    return tuple(sorted(_count_keywords(tokenize(normalize(user_text))).items()))
+
+
+def _load_tables(buckets: dict[str, dict[str, Any]]) -> None:
+    """
+    Derive every matching table from `buckets` (BUCKETS at import) and drop
+    results cached from the previous tables.
+    """
+    global _BUCKET_NAMES, _BUCKET_RISKS, _BUCKET_WEIGHTS, _KEYWORDS, _KEYWORD_BUCKETS
+    global _KEYWORD_TRIE, _SINGLE_WORD_KEYWORDS, _KEYWORD_START_WORDS
+
+    _BUCKET_NAMES = tuple(buckets)
+    _BUCKET_RISKS = tuple(bucket_data["risk"] for bucket_data in buckets.values())
+    _BUCKET_WEIGHTS = tuple(bucket_data["weight"] for bucket_data in buckets.values())
+    _KEYWORDS = tuple(keyword for bucket_data in buckets.values() for keyword in bucket_data["keywords"])
+    _KEYWORD_BUCKETS = tuple(
+        bucket_id for bucket_id, bucket_data in enumerate(buckets.values()) for _ in bucket_data["keywords"]
+    )
+    _KEYWORD_TRIE = _build_keyword_trie(_KEYWORDS)
+    _SINGLE_WORD_KEYWORDS = tuple(
+        (keyword_id, keyword) for keyword_id, keyword in enumerate(_KEYWORDS) if len(keyword.split()) == 1
+    )
+    _KEYWORD_START_WORDS = frozenset(_KEYWORD_TRIE) | frozenset(keyword for _, keyword in _SINGLE_WORD_KEYWORDS)
+    _cached_keyword_counts.cache_clear()
 
-    max_gap = 2 if len(keyword_tokens) >= 3 else 1
-    gap = r"(?:\s+\w+){0," + str(max_gap) + r"}\s+"
 
-    pattern = r"\b" + re.escape(keyword_tokens[0]) + r"\b"
-    for token in keyword_tokens[1:]:
-        pattern += gap + r"\b" + re.escape(token) + r"\b"
-    return pattern
+_load_tables(BUCKETS)
 
 
-def check_buckets(user_text: str) -> dict:
+def _scan_buckets(user_text: str) -> tuple[dict[str, dict[str, Any]], bool, int]:
+    """
+    Build the check_buckets result while accumulating whether a hard-stop
+    risk was hit and the total weight, so deciding needs no second pass.
+    Every counted keyword occurs at least once, so each one adds
+    bucket weight * count to the total.
+    """
+    hits: dict[str, dict[str, Any]] = {}
+    hard_stop = False
+    total_weight = 0
+
+    for keyword_id, count in _cached_keyword_counts(user_text):
+        bucket_id = _KEYWORD_BUCKETS[keyword_id]
+        bucket_name = _BUCKET_NAMES[bucket_id]
+        bucket_hit = hits.get(bucket_name)
+        if bucket_hit is None:
+            bucket_hit = hits[bucket_name] = {
+                "risk": _BUCKET_RISKS[bucket_id],
+                "weight": _BUCKET_WEIGHTS[bucket_id],
+                "matches": [],
+                "count": 0
+            }
+        bucket_hit["matches"].append(_KEYWORDS[keyword_id])
+        bucket_hit["count"] += count
+        hard_stop = hard_stop or _BUCKET_RISKS[bucket_id] in _HARD_STOP_RISKS
+        total_weight += _BUCKET_WEIGHTS[bucket_id] * count
+
+    return hits, hard_stop, total_weight
+
+
+def check_buckets(user_text: str) -> dict[str, dict[str, Any]]:
     """
     Returns a dict of buckets hit with their risk levels and match details.
     Uses tokenized matching with limited word gaps to reduce trivial bypasses.
@@ -204,39 +397,24 @@ def check_buckets(user_text: str) -> dict:
         }
     }
     """
-    text = normalize(user_text)
-    tokens = tokenize(text)
-    tokens_text = " ".join(tokens)
-    hits = {}
-
-    for bucket_name, bucket_data in BUCKETS.items():
-        matches = []
-        count = 0
-        for keyword in bucket_data["keywords"]:
-            pattern = _keyword_pattern(keyword.split())
-            if not pattern:
-                continue
-            found = re.findall(pattern, tokens_text)
-            if found:
-                matches.append(keyword)
-                count += len(found)
-
-        if matches:
-            hits[bucket_name] = {
-                "risk": bucket_data["risk"],
-                "weight": bucket_data["weight"],
-                "matches": matches,
-                "count": count
-            }
-
-    return hits
+    return _scan_buckets(user_text)[0]
 
 # ----------------------------
 # Decision Logic
 # ----------------------------
 
 
-def decide_action(bucket_hits: dict) -> str:
+def _action_for(hard_stop: bool, total_weight: int) -> str:
+    if hard_stop:
+        return "BLOCK"
+    if total_weight >= 6:
+        return "BLOCK"
+    if total_weight >= 3:
+        return "RESTRICT"
+    return "ALLOW"
+
+
+def decide_action(bucket_hits: dict[str, dict[str, Any]]) -> str:
     """
     Decide what to do based on bucket hits.
     Possible outputs:
@@ -244,37 +422,22 @@ def decide_action(bucket_hits: dict) -> str:
     - RESTRICT
     - BLOCK
     """
-
-    risks = [info["risk"] for info in bucket_hits.values()]
-
-    # Hard stops
-    if "critical" in risks:
-        return "BLOCK"
-
-    if "high" in risks:
-        return "BLOCK"
-
+    hard_stop = any(info["risk"] in _HARD_STOP_RISKS for info in bucket_hits.values())
     total_weight = sum(info["weight"] * max(1, info["count"]) for info in bucket_hits.values())
-
-    if total_weight >= 6:
-        return "BLOCK"
-    if total_weight >= 3:
-        return "RESTRICT"
-
-    return "ALLOW"
+    return _action_for(hard_stop, total_weight)
 
 # ----------------------------
 # Public API
 # ----------------------------
 
 
-def filter_prompt(user_text: str) -> dict:
+def filter_prompt(user_text: str) -> dict[str, Any]:
     """
     Main entry point.
     Returns decision and reasoning.
     """
-    bucket_hits = check_buckets(user_text)
-    action = decide_action(bucket_hits)
+    bucket_hits, hard_stop, total_weight = _scan_buckets(user_text)
+    action = _action_for(hard_stop, total_weight)
 
     return {
         "action": action,